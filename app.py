@@ -1,9 +1,11 @@
 import os
+import hashlib
+import hmac
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import streamlit as st
-import pandas as pd
 from datetime import datetime
-from groq import Groq
-from openai import OpenAI
 
 # ==========================================
 # 1. INITIALIZATION & CONFIGURATION
@@ -17,9 +19,69 @@ st.set_page_config(
 
 # Models Configuration
 GROQ_MODEL = "llama-3.3-70b-versatile" 
+GROQ_TEMPERATURE = 0.6
 # مسار نموذج DeepSeek عبر OpenRouter
 OPENROUTER_DEEPSEEK_MODEL = "deepseek/deepseek-r1" 
 
+# Shared HTTP transport limits (connection pool & keep-alive across AI calls)
+HTTP_MAX_CONNECTIONS = 8
+HTTP_MAX_KEEPALIVE = 4
+# httpx drops idle sockets after 5s by default; users pause longer than that between clicks
+HTTP_KEEPALIVE_EXPIRY = 60.0
+# Read / connect timeouts: fail fast on a dead host, still allow long generations
+API_READ_TIMEOUT = 30.0
+API_CONNECT_TIMEOUT = 3.05
+# SDK retries back off exponentially on 408/409/429/5xx and connection errors
+API_MAX_RETRIES = 3
+# Blocking R1 calls send nothing until the whole generation is done, so they get a long read
+# timeout and are not retried (a retried timeout re-bills the same slow generation)
+OPENROUTER_BLOCKING_READ_TIMEOUT = 300.0
+OPENROUTER_BLOCKING_MAX_RETRIES = 0
+# In-flight requests per provider across all sessions; extra callers queue briefly instead of tripping 429s
+AI_MAX_IN_FLIGHT = 4
+# Longest a request waits for a free slot before the user is told the provider is busy
+AI_SLOT_WAIT_TIMEOUT = 20.0
+# More workers than pooled connections would only queue on the HTTP pool
+AI_MAX_WORKERS = HTTP_MAX_CONNECTIONS
+
+# Generation budgets: max_tokens bounds latency; R1 also spends tokens on <think>,
+# and its reasoning trace routinely runs to a few thousand tokens before the answer starts
+DEFAULT_MAX_TOKENS = 1500
+REASONING_TOKEN_ALLOWANCE = 4000
+
+# AI Task Prompts
+CANVAS_SYSTEM_PROMPT = "You are a startup expert. Generate a Business Model Canvas. Use clear Markdown."
+COMPETITOR_SYSTEM_PROMPT = "You are a Senior Market Researcher. Analyze the given niche, identify 3 competitors, and find market gaps."
+SURVEY_SYSTEM_PROMPT = "You are a UX Researcher. Draft a 10-question customer discovery survey for the given niche."
+SIZING_SYSTEM_PROMPT = "You are a Market Analyst. Estimate TAM, SAM and SOM for the given niche and state your assumptions."
+GATE_REVIEW_SYSTEM_PROMPT = "You are a Stage-Gate review board AI. Assess Market Attractiveness, Technical Feasibility, and Risk. Give a GO or NO-GO recommendation."
+LAUNCH_COPY_SYSTEM_PROMPT = "You are a master copywriter. Create a compelling landing page headline, subheadline, and 3 bullet points."
+
+# task -> (system prompt, max_tokens)
+AI_TASKS = {
+    "canvas": (CANVAS_SYSTEM_PROMPT, 700),
+    "competitor": (COMPETITOR_SYSTEM_PROMPT, DEFAULT_MAX_TOKENS),
+    "survey": (SURVEY_SYSTEM_PROMPT, DEFAULT_MAX_TOKENS),
+    "sizing": (SIZING_SYSTEM_PROMPT, DEFAULT_MAX_TOKENS),
+    "gate_review": (GATE_REVIEW_SYSTEM_PROMPT, DEFAULT_MAX_TOKENS),
+    "launch_copy": (LAUNCH_COPY_SYSTEM_PROMPT, 300)
+}
+
+# Phase 2 "Full Market Pack": (column title, task)
+MARKET_PACK = (
+    ("Competitor Analysis", "competitor"),
+    ("Survey Template", "survey"),
+    ("Niche Sizing", "sizing")
+)
+
+# Product pipeline vocabularies (fixed category codes for the products table)
+PRODUCT_TYPES = ["Digital", "Physical"]
+PRODUCT_STAGES = ["1. Concept", "2. Market Research", "3. Prototyping", "4. Validation", "5. Marketing & Launch"]
+PRODUCT_STATUSES = ["Draft", "Active"]
+
+# Password hashing (PBKDF2-HMAC-SHA256)
+PASSWORD_ITERATIONS = 100_000
+
 # Mock User Database
 USERS = {
     "founder": {"password": "password", "name": "Startup Founder", "role": "Admin"},
@@ -29,75 +91,443 @@ USERS = {
 # ==========================================
 # 2. CORE UTILITIES & DUAL AI ENGINE
 # ==========================================
+# يُبنى الجدول مرة واحدة لكل العملية ويُشارك بين كل الجلسات
+@st.cache_data(show_spinner=False)
+def load_products():
+    # pandas يُحمَّل هنا فقط، فصفحة الدخول لا تدفع كلفة استيراده
+    import pandas as pd
+    return pd.DataFrame([
+        {"id": "PROD-01", "name": "Ai3DGen", "type": "Digital", "stage": "2. Market Research", "status": "Active"},
+        {"id": "PROD-02", "name": "BlenderFlow", "type": "Digital", "stage": "3. Prototyping", "status": "Active"},
+        {"id": "PROD-03", "name": "Smart Home Hub", "type": "Physical", "stage": "1. Concept", "status": "Draft"}
+    ]).astype({
+        "type": pd.CategoricalDtype(PRODUCT_TYPES),
+        "stage": pd.CategoricalDtype(PRODUCT_STAGES, ordered=True),
+        "status": pd.CategoricalDtype(PRODUCT_STATUSES)
+    })
+
 def init_mock_data():
     if "products" not in st.session_state:
-        st.session_state.products = pd.DataFrame([
-            {"id": "PROD-01", "name": "Ai3DGen", "type": "Digital", "stage": "2. Market Research", "status": "Active"},
-            {"id": "PROD-02", "name": "BlenderFlow", "type": "Digital", "stage": "3. Prototyping", "status": "Active"},
-            {"id": "PROD-03", "name": "Smart Home Hub", "type": "Physical", "stage": "1. Concept", "status": "Draft"}
-        ])
+        # cache_data يعيد نسخة مستقلة في كل استدعاء، فلا حاجة لـ copy()
+        st.session_state.products = load_products()
+    
+    if "products_version" not in st.session_state:
+        # يُزاد هذا العداد عند كل تعديل على جدول المنتجات لإبطال القيم المشتقة
+        st.session_state.products_version = 0
     
     if "canvas" not in st.session_state:
         st.session_state.canvas = {}
 
-def call_ai(system_prompt, user_prompt):
-    provider = st.session_state.get("ai_provider", "Groq (Llama 3.3)")
+# المنتجات خاصة بكل جلسة، لذا تُحفظ القيم المشتقة في session_state
+# بدل st.cache_data (المشترك بين الجلسات) وتُعاد فقط عند تغيّر الإصدار
+def _products_derived(name, build):
+    version = st.session_state.products_version
+    derived = st.session_state.setdefault("_products_derived", {})
+    cached = derived.get(name)
+    if cached is None or cached[0] != version:
+        cached = (version, build(st.session_state.products))
+        derived[name] = cached
+    return cached[1]
+
+def product_names():
+    return _products_derived("names", lambda df: df['name'].tolist())
+
+def _build_dashboard_stats(df):
+    # تمريرة واحدة لكل عمود بدل قناع منطقي لكل مؤشر
+    status_counts = df['status'].value_counts()
+    stage_counts = df['stage'].value_counts()
+    return {
+        "active": int(status_counts.get('Active', 0)),
+        "concept": int(stage_counts.get('1. Concept', 0)),
+        "ready": int(stage_counts.get('5. Marketing & Launch', 0))
+    }
+
+def dashboard_stats():
+    return _products_derived("dashboard_stats", _build_dashboard_stats)
+
+def _build_products_arrow(df):
+    import pyarrow as pa
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+# st.dataframe يقبل جدول Arrow مباشرة، فلا يُعاد تحويل DataFrame في كل إعادة تشغيل
+def products_arrow():
+    return _products_derived("arrow", _build_products_arrow)
+
+# الطريقة المعتمدة للمرور على صفوف DataFrame في الواجهة: لا تستخدم iterrows()
+# لأنه يبني pd.Series لكل صف. مع أعمدة محددة نمرّ على قوائم بايثون مباشرة
+# (الأسرع)، وبدونها نعيد dicts عادية عبر to_dict("records")
+def rows_fast(df, *columns):
+    if columns:
+        return zip(*(df[col].tolist() for col in columns))
+    return df.to_dict(orient="records")
+
+# مجمع اتصالات مشترك حتى لا نعيد مصافحة TLS مع كل طلب
+@st.cache_resource(show_spinner=False)
+def get_http_client():
+    import httpx
+    return httpx.Client(
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(API_READ_TIMEOUT, connect=API_CONNECT_TIMEOUT)
+    )
+
+# البحث في المتغيرات و secrets مرة واحدة لكل مفتاح طوال عمر العملية
+# المفتاح المفقود لا يُخزَّن، فإضافته لاحقاً إلى secrets تعمل دون إعادة تشغيل
+@st.cache_resource(show_spinner=False)
+def _lookup_key(name):
+    try:
+        key = os.getenv(name) or st.secrets.get(name)
+    except FileNotFoundError:
+        # لا يوجد secrets.toml أصلاً (StreamlitSecretNotFoundError): نعامله كمفتاح مفقود
+        key = None
+    if not key:
+        raise KeyError(name)
+    return key
+
+def _resolve_key(name):
+    try:
+        return _lookup_key(name)
+    except KeyError:
+        return None
+
+# عميل واحد لكل مزود يعيش طوال عمر العملية ويعيد استخدام مجمع الاتصالات
+@st.cache_resource(show_spinner=False)
+def get_groq_client():
+    # استيراد متأخر: لا يدفع المستخدم كلفة تحميل SDK قبل أول طلب
+    from groq import Groq
+    http_client = get_http_client()
+    return Groq(
+        api_key=_resolve_key("GROQ_API_KEY"),
+        http_client=http_client,
+        timeout=http_client.timeout,
+        max_retries=API_MAX_RETRIES
+    )
+
+@st.cache_resource(show_spinner=False)
+def get_openrouter_client():
+    from openai import OpenAI
+    http_client = get_http_client()
+    # توجيه الاتصال إلى خوادم OpenRouter
+    return OpenAI(
+        api_key=_resolve_key("OPENROUTER_API_KEY"), 
+        base_url="https://openrouter.ai/api/v1",
+        http_client=http_client,
+        timeout=http_client.timeout,
+        max_retries=API_MAX_RETRIES,
+        default_headers={
+            "HTTP-Referer": "https://launchpad-os.streamlit.app", # رابط تطبيقك
+            "X-Title": "LaunchPad OS", # اسم تطبيقك
+        }
+    )
+
+# حد مشترك لكل مزود: الطلبات الزائدة تنتظر دورها بدل أن تنهال عليها أخطاء 429
+@st.cache_resource(show_spinner=False)
+def get_ai_slots(provider_name):
+    return threading.BoundedSemaphore(AI_MAX_IN_FLIGHT)
+
+class ProviderBusyError(Exception):
+    pass
+
+# الانتظار محدود: إن بقيت كل الأماكن مشغولة (بث طويل مثلاً) يُرفع خطأ مقروء بدل التعليق
+@contextmanager
+def ai_slot(provider_name):
+    slots = get_ai_slots(provider_name)
+    if not slots.acquire(timeout=AI_SLOT_WAIT_TIMEOUT):
+        raise ProviderBusyError("the provider is busy with other requests. Please try again in a moment.")
+    try:
+        yield
+    finally:
+        slots.release()
+
+# رد فارغ أو مقطوع عند حد التوكنات: يُرفع كاستثناء حتى لا يُخزَّن في أي كاش
+class IncompleteAnswerError(Exception):
+    def __init__(self, reason, partial=""):
+        super().__init__(reason)
+        self.partial = partial
+
+def _ensure_complete(answered, finish_reason, partial=""):
+    if finish_reason == "length":
+        raise IncompleteAnswerError("the answer was cut off at the token limit. Please try again.", partial)
+    if not answered:
+        raise IncompleteAnswerError("the model returned an empty answer. Please try again.")
+
+def _completion_args(model, system_prompt, user_prompt, max_tokens, stop):
+    args = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        "max_tokens": max_tokens
+    }
+    if stop:
+        args["stop"] = list(stop)
+    return args
+
+# الردود المتطابقة تُخدم من الذاكرة بدل إعادة الطلب مع كل إعادة تشغيل
+# الأخطاء تُرفع كاستثناءات حتى لا تُخزّن في الكاش
+@st.cache_data(ttl=3600, max_entries=256, show_spinner=False)
+def call_groq(system_prompt, user_prompt, model=GROQ_MODEL, max_tokens=DEFAULT_MAX_TOKENS, stop=None, temperature=GROQ_TEMPERATURE):
+    with ai_slot("groq"):
+        completion = get_groq_client().chat.completions.create(
+            **_completion_args(model, system_prompt, user_prompt, max_tokens, stop),
+            temperature=temperature
+        )
+    choice = completion.choices[0]
+    text = choice.message.content or ""
+    _ensure_complete(bool(text.strip()), choice.finish_reason, text)
+    return text
+
+@st.cache_data(ttl=3600, max_entries=256, show_spinner=False)
+def call_openrouter(system_prompt, user_prompt, model=OPENROUTER_DEEPSEEK_MODEL, max_tokens=DEFAULT_MAX_TOKENS, stop=None):
+    import httpx
+    client = get_openrouter_client().with_options(
+        timeout=httpx.Timeout(OPENROUTER_BLOCKING_READ_TIMEOUT, connect=API_CONNECT_TIMEOUT),
+        max_retries=OPENROUTER_BLOCKING_MAX_RETRIES
+    )
+    with ai_slot("openrouter"):
+        completion = client.chat.completions.create(
+            **_completion_args(model, system_prompt, user_prompt, max_tokens, stop)
+        )
     
+    choice = completion.choices[0]
+    text = _strip_think(choice.message.content or "")
+    _ensure_complete(bool(text.strip()), choice.finish_reason, text)
+    return text
+
+# تنظيف وسوم التفكير الخاصة بـ DeepSeek R1 لتكون الواجهة أنظف
+# rpartition يقسم مرة واحدة من اليمين بدل بناء قائمة بكل الأجزاء
+def _strip_think(text):
+    _, sep, tail = text.rpartition("</think>")
+    return tail.strip() if sep else text
+
+def _missing_key_error(provider):
+    if "Groq" in provider and not _resolve_key("GROQ_API_KEY"):
+        return "Error: GROQ_API_KEY is missing."
+    # قراءة مفتاح OpenRouter بدلاً من DeepSeek المباشر
+    if "DeepSeek" in provider and not _resolve_key("OPENROUTER_API_KEY"):
+        return "Error: OPENROUTER_API_KEY is missing. Please add it to Streamlit Secrets."
+    return None
+
+def _api_error(provider, error):
     if "Groq" in provider:
-        api_key = os.getenv("GROQ_API_KEY") or st.secrets.get("GROQ_API_KEY")
-        if not api_key: return "Error: GROQ_API_KEY is missing."
-        
-        client = Groq(api_key=api_key)
-        try:
-            completion = client.chat.completions.create(
-                model=GROQ_MODEL,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.6,
-                max_tokens=1500
-            )
-            return completion.choices[0].message.content
-        except Exception as e:
-            return f"Groq API Error: {str(e)}"
-            
-    elif "DeepSeek" in provider:
-        # قراءة مفتاح OpenRouter بدلاً من DeepSeek المباشر
-        api_key = os.getenv("OPENROUTER_API_KEY") or st.secrets.get("OPENROUTER_API_KEY")
-        if not api_key: return "Error: OPENROUTER_API_KEY is missing. Please add it to Streamlit Secrets."
-        
-        # توجيه الاتصال إلى خوادم OpenRouter
-        client = OpenAI(
-            api_key=api_key, 
-            base_url="https://openrouter.ai/api/v1",
-            default_headers={
-                "HTTP-Referer": "https://launchpad-os.streamlit.app", # رابط تطبيقك
-                "X-Title": "LaunchPad OS", # اسم تطبيقك
-            }
+        from groq import APITimeoutError
+        label = "Groq"
+    else:
+        from openai import APITimeoutError
+        label = "OpenRouter"
+    if isinstance(error, APITimeoutError):
+        return f"{label} API Error: the request timed out. Please try again."
+    return f"{label} API Error: {str(error)}"
+
+# يحوّل الاستثناءات إلى رسائل للواجهة؛ ما تحته يرفعها حتى لا تُخزَّن في الكاش
+def _guarded(provider, complete, *args):
+    error = _missing_key_error(provider)
+    if error:
+        return error
+    try:
+        return complete(*args)
+    except IncompleteAnswerError as e:
+        # الجزء المقطوع يُعرض مرة واحدة مع التنبيه لكنه لا يُخزَّن
+        notice = _api_error(provider, e)
+        return f"{e.partial}\n\n{notice}" if e.partial else notice
+    except Exception as e:
+        return _api_error(provider, e)
+
+# st.cache_data يبني المفتاح من الوسائط المُمرَّرة فقط (لا القيم الافتراضية ولا الثوابت)،
+# لذا يُحسم النموذج ودرجة الحرارة والميزانية الفعلية هنا وتُمرَّر صراحة حتى يُبطَل الكاش عند تغييرها
+def _request_settings(provider, max_tokens):
+    if "Groq" in provider:
+        return GROQ_MODEL, GROQ_TEMPERATURE, max_tokens
+    # R1 يستهلك جزءاً من الميزانية في وسم <think> قبل الإجابة
+    return OPENROUTER_DEEPSEEK_MODEL, None, max_tokens + REASONING_TOKEN_ALLOWANCE
+
+def _complete_with(system_prompt, user_prompt, provider, model, temperature, max_tokens, stop=None):
+    if "Groq" in provider:
+        return call_groq(system_prompt, user_prompt, model, max_tokens, stop, temperature)
+    return call_openrouter(system_prompt, user_prompt, model, max_tokens, stop)
+
+def _complete(system_prompt, user_prompt, provider, max_tokens=DEFAULT_MAX_TOKENS, stop=None):
+    model, temperature, max_tokens = _request_settings(provider, max_tokens)
+    return _complete_with(system_prompt, user_prompt, provider, model, temperature, max_tokens, stop)
+
+def call_ai(system_prompt, user_prompt, provider=None, max_tokens=DEFAULT_MAX_TOKENS, stop=None):
+    # المزود يُمرَّر صراحة عند الاستدعاء من خيوط لا ترى session_state
+    provider = provider or st.session_state.get("ai_provider", "Groq (Llama 3.3)")
+    return _guarded(provider, _complete, system_prompt, user_prompt, provider, max_tokens, stop)
+
+# الـ Canvas يُحفظ على القرص فيبقى بعد إغلاق الجلسة أو إعادة تشغيل الخادم
+# المفتاح هو نص الفكرة كاملاً (لا أول 20 حرفاً) مع كل مدخلات الطلب، فلا TTL هنا
+# وأي تغيير في التعليمات أو النموذج أو الميزانية يولّد مفتاحاً جديداً
+@st.cache_data(persist="disk", max_entries=256, show_spinner=False)
+def generate_canvas_cached(idea, provider, system_prompt, model, temperature, max_tokens):
+    return _complete_with(system_prompt, idea, provider, model, temperature, max_tokens)
+
+def generate_canvas(idea, provider=None):
+    provider = provider or st.session_state.get("ai_provider", "Groq (Llama 3.3)")
+    system_prompt, max_tokens = AI_TASKS["canvas"]
+    model, temperature, max_tokens = _request_settings(provider, max_tokens)
+    return _guarded(provider, generate_canvas_cached, idea, provider, system_prompt, model, temperature, max_tokens)
+
+def run_task(name, user_prompt, provider=None):
+    system_prompt, max_tokens = AI_TASKS[name]
+    return call_ai(system_prompt, user_prompt, provider, max_tokens)
+
+# مجمع خيوط واحد للعملية بدل إنشاء خيوط جديدة مع كل نقرة
+@st.cache_resource(show_spinner=False)
+def get_ai_executor():
+    return ThreadPoolExecutor(max_workers=AI_MAX_WORKERS, thread_name_prefix="ai")
+
+# الطلبات المستقلة تنتظر الشبكة بالتوازي بدل التسلسل
+def run_tasks_concurrently(tasks, provider=None):
+    provider = provider or st.session_state.get("ai_provider", "Groq (Llama 3.3)")
+    executor = get_ai_executor()
+    futures = {
+        executor.submit(run_task, name, user_prompt, provider): i
+        for i, (name, user_prompt) in enumerate(tasks)
+    }
+    for future in as_completed(futures):
+        yield futures[future], future.result()
+
+# البث التدريجي: تظهر أول الكلمات خلال لحظات بدل انتظار الرد كاملاً
+def stream_groq(system_prompt, user_prompt, model=GROQ_MODEL, max_tokens=DEFAULT_MAX_TOKENS, stop=None, temperature=GROQ_TEMPERATURE):
+    with ai_slot("groq"):
+        stream = get_groq_client().chat.completions.create(
+            **_completion_args(model, system_prompt, user_prompt, max_tokens, stop),
+            temperature=temperature,
+            stream=True
         )
+        finish = []
+        answered = False
+        for text in _delta_text(stream, finish):
+            answered = answered or bool(text.strip())
+            yield text
+    _ensure_complete(answered, finish[-1] if finish else None)
+
+def stream_openrouter(system_prompt, user_prompt, model=OPENROUTER_DEEPSEEK_MODEL, max_tokens=DEFAULT_MAX_TOKENS, stop=None):
+    with ai_slot("openrouter"):
+        stream = get_openrouter_client().chat.completions.create(
+            **_completion_args(model, system_prompt, user_prompt, max_tokens, stop),
+            stream=True
+        )
+        finish = []
+        answered = False
+        for text in _skip_think(_delta_text(stream, finish)):
+            answered = answered or bool(text.strip())
+            yield text
+    _ensure_complete(answered, finish[-1] if finish else None)
+
+def _delta_text(stream, finish):
+    # finish: تُضاف إليها finish_reason عند وصولها في آخر قطعة
+    for chunk in stream:
+        if chunk.choices:
+            choice = chunk.choices[0]
+            if choice.finish_reason:
+                finish.append(choice.finish_reason)
+            yield choice.delta.content or ""
+
+def _skip_think(chunks):
+    # نحجز بداية الرد فقط إذا بدأ بوسم <think> ثم نبث ما بعد </think>
+    head = ""
+    for chunk in chunks:
+        if head is None:
+            yield chunk
+            continue
+        head += chunk
+        if "</think>" in head:
+            yield head.rpartition("</think>")[2].lstrip()
+            head = None
+        elif len(head.lstrip()) >= len("<think>") and not head.lstrip().startswith("<think>"):
+            yield head
+            head = None
+    # وسم <think> لم يُغلق (نفدت الميزانية أثناء التفكير): لا إجابة لعرضها
+    if head and not head.lstrip().startswith("<think>"):
+        yield head
+
+# errors (اختياري): قائمة تُضاف إليها رسالة الخطأ ليعرف المستدعي أن البث فشل
+def call_ai_stream(system_prompt, user_prompt, max_tokens=DEFAULT_MAX_TOKENS, stop=None, errors=None):
+    provider = st.session_state.get("ai_provider", "Groq (Llama 3.3)")
+    error = _missing_key_error(provider)
+    if error is None:
+        model, temperature, max_tokens = _request_settings(provider, max_tokens)
+        if "Groq" in provider:
+            stream = stream_groq(system_prompt, user_prompt, model, max_tokens, stop, temperature)
+        else:
+            stream = stream_openrouter(system_prompt, user_prompt, model, max_tokens, stop)
         try:
-            completion = client.chat.completions.create(
-                model=OPENROUTER_DEEPSEEK_MODEL,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                max_tokens=2000
-            )
-            
-            response_text = completion.choices[0].message.content
-            # تنظيف وسوم التفكير الخاصة بـ DeepSeek R1 لتكون الواجهة أنظف
-            if "</think>" in response_text:
-                response_text = response_text.split("</think>")[-1].strip()
-                
-            return response_text
+            yield from stream
+            return
         except Exception as e:
-            return f"OpenRouter API Error: {str(e)}"
+            # القطع أو الخطأ بعد بدء البث يظهر تحت النص المعروض لا ملتصقاً به
+            error = "\n\n" + _api_error(provider, e)
+    
+    if errors is not None:
+        errors.append(error)
+    yield error
+
+def run_task_stream(name, user_prompt, errors=None):
+    system_prompt, max_tokens = AI_TASKS[name]
+    return call_ai_stream(system_prompt, user_prompt, max_tokens, errors=errors)
+
+def write_ai_stream(chunks, element="markdown"):
+    # element: markdown / info / success ... نفس نمط العرض السابق لكل مرحلة
+    placeholder = st.empty()
+    text = ""
+    for chunk in chunks:
+        text += chunk
+        getattr(placeholder, element)(text)
+    return text
+
+# يُحفظ النص النهائي فقط بعد اكتمال البث بنجاح؛ إعادة النقر على نفس المدخلات
+# تعرض النتيجة فوراً بدل بث جديد
+def stream_task(name, user_prompt, element="markdown"):
+    provider = st.session_state.get("ai_provider", "Groq (Llama 3.3)")
+    key = (provider, name, user_prompt)
+    finished = st.session_state.setdefault("finished_streams", {})
+    if key in finished:
+        getattr(st, element)(finished[key])
+        return finished[key]
+    
+    errors = []
+    text = write_ai_stream(run_task_stream(name, user_prompt, errors), element)
+    if not errors and text.strip():
+        finished[key] = text
+    return text
 
 # ==========================================
 # 3. AUTHENTICATION MODULE
 # ==========================================
+def _hash_password(password, salt):
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, PASSWORD_ITERATIONS)
+
+# تجزئة كلمات المرور مرة واحدة لكل العملية (السكربت يُعاد تنفيذه مع كل تفاعل)
+@st.cache_resource(show_spinner=False)
+def get_user_store():
+    store = {}
+    for username, user in USERS.items():
+        salt = os.urandom(16)
+        store[username] = {"salt": salt, "pw_hash": _hash_password(user["password"], salt)}
+    return store
+
+# سجل وهمي يُقارن به عند اسم مستخدم غير موجود حتى يستغرق الرفض نفس الوقت
+@st.cache_resource(show_spinner=False)
+def get_dummy_user_record():
+    salt = os.urandom(16)
+    return {"salt": salt, "pw_hash": _hash_password(os.urandom(16).hex(), salt)}
+
+# النقر المزدوج على زر الدخول لا يعيد حساب دالة الاشتقاق
+@st.cache_data(max_entries=32, show_spinner=False)
+def verify_password(username, password):
+    record = get_user_store().get(username)
+    known_user = record is not None
+    if not known_user:
+        record = get_dummy_user_record()
+    matches = hmac.compare_digest(_hash_password(password, record["salt"]), record["pw_hash"])
+    return known_user and matches
+
 def check_auth():
     return st.session_state.get("authenticated", False)
 
@@ -113,7 +543,7 @@ def login_ui():
             submit = st.form_submit_button("Sign In", use_container_width=True)
             
             if submit:
-                if username in USERS and USERS[username]["password"] == password:
+                if verify_password(username, password):
                     st.session_state["authenticated"] = True
                     st.session_state["user"] = USERS[username]
                     st.rerun()
@@ -128,21 +558,23 @@ def logout():
 # ==========================================
 # 4. STAGE-GATE MODULES (UI RENDERERS)
 # ==========================================
+@st.fragment
 def render_dashboard():
     st.header("🏢 Portfolio Dashboard")
     st.markdown("Overview of all active product concepts and their current Stage-Gate status.")
     
-    df = st.session_state.products
+    stats = dashboard_stats()
     
     col1, col2, col3 = st.columns(3)
-    col1.metric("Active Concepts", len(df[df['status'] == 'Active']))
-    col2.metric("Products in Concept Stage", len(df[df['stage'] == '1. Concept']))
-    col3.metric("Ready for Launch", len(df[df['stage'] == '5. Marketing & Launch']))
+    col1.metric("Active Concepts", stats["active"])
+    col2.metric("Products in Concept Stage", stats["concept"])
+    col3.metric("Ready for Launch", stats["ready"])
     
     st.divider()
     st.subheader("Product Pipeline")
-    st.dataframe(df, use_container_width=True, hide_index=True)
+    st.dataframe(products_arrow(), use_container_width=True, hide_index=True)
 
+@st.fragment
 def render_phase1_concept():
     st.header("Phase 1: Concept Definition")
     st.caption(f"Currently using: {st.session_state.get('ai_provider')}")
@@ -152,13 +584,13 @@ def render_phase1_concept():
     if st.button("Generate Business Model Canvas", type="primary"):
         if idea:
             with st.spinner("Analyzing and building canvas..."):
-                sys_prompt = "You are a startup expert. Generate a Business Model Canvas. Use clear Markdown."
-                canvas_result = call_ai(sys_prompt, idea)
+                canvas_result = generate_canvas(idea)
                 st.session_state.canvas[idea[:20]] = canvas_result
                 st.markdown(canvas_result)
         else:
             st.warning("Please describe an idea first.")
 
+@st.fragment
 def render_phase2_market():
     st.header("Phase 2: Market Research & Analysis")
     st.caption(f"Currently using: {st.session_state.get('ai_provider')}")
@@ -168,16 +600,26 @@ def render_phase2_market():
     if st.button("Run Deep Competitor Analysis", type="primary"):
         if niche:
             with st.spinner("Processing market data..."):
-                sys_prompt = "You are a Senior Market Researcher. Analyze the given niche, identify 3 competitors, and find market gaps."
-                st.info(call_ai(sys_prompt, niche))
+                stream_task("competitor", niche, "info")
+        else:
+            st.warning("Enter a niche to analyze.")
+    
+    if st.button("Run Full Market Pack"):
+        if niche:
+            with st.spinner("Running competitor, survey and sizing analysis in parallel..."):
+                cols = st.columns(len(MARKET_PACK))
+                for i, result in run_tasks_concurrently([(task, niche) for _, task in MARKET_PACK]):
+                    with cols[i]:
+                        st.subheader(MARKET_PACK[i][0])
+                        st.markdown(result)
         else:
             st.warning("Enter a niche to analyze.")
 
+@st.fragment
 def render_phase3_prototype():
     st.header("Phase 3: Design & Prototyping (MVP)")
     
-    product_names = st.session_state.products['name'].tolist()
-    st.selectbox("Select Product", product_names)
+    st.selectbox("Select Product", product_names())
     
     with st.expander("Define MVP Features", expanded=True):
         st.text_area("Core feature list for initial launch:")
@@ -185,6 +627,7 @@ def render_phase3_prototype():
         if st.button("Save MVP Definition"):
             st.success("MVP definition saved successfully.")
 
+@st.fragment
 def render_phase4_validation():
     st.header("Phase 4: Testing & Stage-Gate Validation")
     st.caption(f"Currently using: {st.session_state.get('ai_provider')}")
@@ -194,11 +637,11 @@ def render_phase4_validation():
     if st.button("Run AI Gate Assessment (GO / NO-GO)"):
         if product_data:
             with st.spinner("Evaluating gate criteria..."):
-                sys_prompt = "You are a Stage-Gate review board AI. Assess Market Attractiveness, Technical Feasibility, and Risk. Give a GO or NO-GO recommendation."
-                st.success(call_ai(sys_prompt, product_data))
+                stream_task("gate_review", product_data, "success")
         else:
             st.warning("Provide test data for the review board.")
 
+@st.fragment
 def render_phase5_launch():
     st.header("Phase 5: Marketing & Launch")
     st.caption(f"Currently using: {st.session_state.get('ai_provider')}")
@@ -209,20 +652,37 @@ def render_phase5_launch():
     if st.button("Generate Launch Copy"):
         if prod_name and features:
             with st.spinner("Crafting high-converting copy..."):
-                sys_prompt = "You are a master copywriter. Create a compelling landing page headline, subheadline, and 3 bullet points."
-                st.markdown(call_ai(sys_prompt, f"Product: {prod_name}\nFeatures: {features}"))
+                stream_task("launch_copy", f"Product: {prod_name}\nFeatures: {features}")
         else:
             st.warning("Fill in product details.")
 
 # ==========================================
 # 5. MAIN APPLICATION ROUTER
 # ==========================================
+ROUTES = {
+    "Dashboard": render_dashboard,
+    "1. Concept (Canvas)": render_phase1_concept,
+    "2. Market Research": render_phase2_market,
+    "3. Prototyping (MVP)": render_phase3_prototype,
+    "4. Validation (Stage-Gate)": render_phase4_validation,
+    "5. Marketing & Launch": render_phase5_launch
+}
+MENU = tuple(ROUTES)
+
+# st.navigation ينفّذ دالة الصفحة المختارة فقط
+def build_pages():
+    return [
+        st.Page(render, title=title, url_path=render.__name__.removeprefix("render_"), default=(title == MENU[0]))
+        for title, render in ROUTES.items()
+    ]
+
 def main():
-    init_mock_data()
-    
     if not check_auth():
         login_ui()
         return
+    
+    # البيانات تُهيّأ بعد الدخول فقط حتى يبقى الزائر غير المسجَّل خفيفاً
+    init_mock_data()
 
     with st.sidebar:
         st.title("🚀 LaunchPad OS")
@@ -238,26 +698,10 @@ def main():
         )
         st.divider()
         
-        menu = [
-            "Dashboard", 
-            "1. Concept (Canvas)", 
-            "2. Market Research", 
-            "3. Prototyping (MVP)", 
-            "4. Validation (Stage-Gate)", 
-            "5. Marketing & Launch"
-        ]
-        choice = st.radio("Pipeline Stages", menu)
-        
-        st.divider()
         if st.button("Logout", use_container_width=True):
             logout()
 
-    if choice == "Dashboard": render_dashboard()
-    elif choice == "1. Concept (Canvas)": render_phase1_concept()
-    elif choice == "2. Market Research": render_phase2_market()
-    elif choice == "3. Prototyping (MVP)": render_phase3_prototype()
-    elif choice == "4. Validation (Stage-Gate)": render_phase4_validation()
-    elif choice == "5. Marketing & Launch": render_phase5_launch()
+    st.navigation(build_pages()).run()
 
 if __name__ == "__main__":
     main()